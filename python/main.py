@@ -1,9 +1,10 @@
 import os
 import argparse
 import importlib
-import json
 import sys
-from flask import Flask, request, jsonify
+import orjson
+from flask import Flask, abort, request
+from flask.json.provider import JSONProvider
 
 # --- Command Line Arguments ---
 parser = argparse.ArgumentParser(description="Run a Code Battle Bot.")
@@ -33,31 +34,53 @@ except AttributeError:
     exit()
 
 # --- Flask Web Server ---
+class OrjsonProvider(JSONProvider):
+    """Routes Flask's own JSON handling (jsonify, get_json) through orjson."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+def read_game_state():
+    try:
+        return orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        abort(400)  # As Flask's get_json does for a malformed body.
+
+# get_info() and /ping never change, so their responses are built once at startup.
+INFO_RESPONSE = app.response_class(orjson.dumps(strategy_instance.get_info()), mimetype="application/json")
+PONG_RESPONSE = app.response_class(b"pong", mimetype="text/plain")
 
 @app.route("/")
 def index():
-    return jsonify(strategy_instance.get_info())
+    return INFO_RESPONSE
 
 @app.route("/ping")
 def ping():
-    return "pong"
+    return PONG_RESPONSE
 
 @app.route("/start", methods=["POST"])
 def start():
-    strategy_instance.on_game_start(request.get_json())
+    strategy_instance.on_game_start(read_game_state())
     return "ok"
 
 @app.route("/move", methods=["POST"])
 def move():
-    return strategy_instance.on_game_move(request.get_json())
+    result = strategy_instance.on_game_move(read_game_state())
+    return app.response_class(orjson.dumps(result), mimetype="application/json")
 
 @app.route("/end", methods=["POST"])
 def end():
-    strategy_instance.on_game_end(request.get_json())
+    strategy_instance.on_game_end(read_game_state())
     return "ok"
 
 if __name__ == "__main__":
+    from waitress import serve
     port = int(os.environ.get("PORT", args.port))
-    app.run(host="0.0.0.0", port=port, debug=False)
+    # A production WSGI server, so a slow /move in one game does not block requests from others.
+    serve(app, host="0.0.0.0", port=port, threads=8)
 
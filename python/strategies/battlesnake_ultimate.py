@@ -1,27 +1,122 @@
-import copy
+import sys
+import threading
+import time
+from array import array
+from typing import Iterator
 from strategies.abstract_strategy import AbstractStrategy
-from utils.spatial_utils import a_star, flood_fill
-from utils.game_theory_utils import expectimax
+from utils import battlesnake_engine
+from utils.spatial_utils import (NUMBA_AVAILABLE, flood_fill, flood_fill_scratch, territory, territory_scratch,
+                                 decode, warm_up)
+from utils.game_theory_utils import minimax, zobrist_hash, TimeUp
+
+class _TurnState(threading.local):
+    """
+    Per-turn search caches and reusable work buffers. Thread-local so one Strategy
+    can play several games at once.
+    """
+    def __init__(self):
+        self.transposition_table = {}
+        self.board_size = None
+        self.engine_buffers = None
+
+    def prepare(self, width: int, height: int):
+        """Starts a new turn, allocating the work buffers only when the board size changes."""
+        self.transposition_table = {}
+        if self.board_size == (width, height): return
+        self.board_size = (width, height)
+        self.empty_board = bytes(width * height)
+        self.obstacles = bytearray(width * height)
+        self.flood_fill_scratch = flood_fill_scratch(width, height)
+        self.territory_scratch = territory_scratch(width, height)
+        self.engine_buffers = None
 
 class Strategy(AbstractStrategy):
-    """The ultimate Battlesnake AI using Expectimax and a powerful heuristic."""
-    SEARCH_DEPTH = 3
+    """The ultimate Battlesnake AI using Minimax with Alpha-Beta pruning and a powerful heuristic."""
+    MAX_SEARCH_DEPTH = 12
+    # Seconds per move spent deepening the search; the game allows about 500ms including network time.
+    TIME_BUDGET = 0.4
     HEURISTIC_WEIGHTS = {'space_adv_weight': 1.0, 'health_adv_weight': 0.1, 'food_control_weight': 5.0}
 
+    def __init__(self):
+        # Compile the kernels now rather than inside the first move's time budget.
+        warm_up()
+        if NUMBA_AVAILABLE: battlesnake_engine.warm_up()
+        self._turn = _TurnState()
+
     def get_info(self):
         return {"apiversion": "1", "author": "UltimateBot", "color": "#FFFFFF", "head": "all-seeing", "tail": "ghost"}
 
     def on_game_move(self, game_state: dict) -> dict:
-        print(f"Turn")
-        
-        return {"apiversion": "1", "author": "UltimateBot", "color": "#FFFFFF", "head": "all-seeing", "tail": "ghost"}
-        
-        # _, best_move = expectimax(
-        #     game_state=game_state, depth=self.SEARCH_DEPTH, is_maximizing_player=True,
-        #     evaluate_func=self._evaluate_heuristic, get_children_func=self._get_children
-        # )
-        # print(f"Turn {game_state['turn']}: ULTIMATE - Best move is {best_move.upper() if best_move else 'UP'}")
-        # return {"move": best_move if best_move else "up"}
+        deadline = time.perf_counter() + self.TIME_BUDGET
+        if NUMBA_AVAILABLE:
+            # Compiled, the fused engine runs a whole search without a Python frame per node.
+            best_move, searched_depth = self._search_with_engine(game_state, deadline)
+        else:
+            best_move, searched_depth = self._search(game_state, deadline)
+        if best_move is None:
+            # Every line loses, even at depth 1; a safe move still outlives a hard-coded one.
+            search_state = self._ingest(game_state)
+            best_move = next(iter(self._get_safe_moves(search_state['you'], search_state)), "up")
+        print(f"Turn {game_state['turn']}: ULTIMATE - Best move is {best_move.upper()} (depth {searched_depth})")
+        return {"move": best_move}
+
+    def _search(self, game_state: dict, deadline: float) -> tuple[str | None, int]:
+        # The opponent is adversarial, not random, so Minimax lets us prune with Alpha-Beta.
+        # The transposition table only holds searches from this turn's root; it is kept
+        # across depths so each iteration searches the previous best moves first.
+        self._turn.prepare(game_state['board']['width'], game_state['board']['height'])
+        game_state = self._ingest(game_state)
+        best_move = None; searched_depth = 0
+        # Iterative deepening: keep the move from the deepest search that finished in time
+        # and found one. Once every line loses, deeper searches return no move either.
+        for depth in range(1, self.MAX_SEARCH_DEPTH + 1):
+            try:
+                _, move = minimax(
+                    game_state, depth, True,
+                    self._evaluate_heuristic, self._get_children, -float('inf'), float('inf'),
+                    self._turn.transposition_table, self._hash_state, deadline
+                )
+            except TimeUp:
+                break
+            if move is None: break
+            best_move = move; searched_depth = depth
+        return best_move, searched_depth
+
+    def _search_with_engine(self, game_state: dict, deadline: float) -> tuple[str | None, int]:
+        # Same search as _search, run by utils.battlesnake_engine. This only marshals
+        # the JSON game state into the engine's buffers and deepens iteratively.
+        board = game_state['board']; board_width = board['width']; board_size = board_width * board['height']
+        you = self._find_snake_in_state(game_state['you']['id'], game_state)
+        snakes = [you] + [snake for snake in board['snakes'] if snake is not you]
+        bodies = [[part['y'] * board_width + part['x'] for part in snake['body']] for snake in snakes]
+        longest = max(len(body) for body in bodies)
+        self._turn.prepare(board_width, board['height'])
+        buffers = self._turn.engine_buffers
+        # A snake can only grow by eating, and there is at most one food per square, so a
+        # search never needs more than longest + board_size slots per ring buffer.
+        if (buffers is None or buffers[0][battlesnake_engine.P_NUM_SNAKES] != len(snakes)
+                or buffers[0][battlesnake_engine.P_CAP] < longest + board_size):
+            # Another board_size of headroom lets the snakes grow that much over the game
+            # before the buffers have to be allocated again.
+            buffers = self._turn.engine_buffers = battlesnake_engine.new_buffers(
+                board_width, board['height'], len(snakes), longest + 2 * board_size, self.MAX_SEARCH_DEPTH)
+        battlesnake_engine.load_position(buffers, bodies, [snake['health'] for snake in snakes],
+                                         [food['y'] * board_width + food['x'] for food in board['food']])
+        weights = array('d', [self.HEURISTIC_WEIGHTS['space_adv_weight'], self.HEURISTIC_WEIGHTS['health_adv_weight'],
+                              self.HEURISTIC_WEIGHTS['food_control_weight']])
+
+        best_move = None; searched_depth = 0; nodes_per_second = None
+        for depth in range(1, self.MAX_SEARCH_DEPTH + 1):
+            started = time.perf_counter()
+            if started >= deadline: break
+            # Compiled code cannot watch the clock, so the deadline becomes a node budget
+            # based on how fast the previous depth ran.
+            node_limit = int(nodes_per_second * (deadline - started)) if nodes_per_second else sys.maxsize
+            _, move, nodes = battlesnake_engine.search(buffers, depth, weights, node_limit)
+            if move is None: break
+            best_move = battlesnake_engine.MOVES[move]; searched_depth = depth
+            nodes_per_second = nodes / max(time.perf_counter() - started, 1e-6)
+        return best_move, searched_depth
 
     def _evaluate_heuristic(self, game_state: dict) -> float:
         my_snake = game_state['you']
@@ -30,72 +125,141 @@ class Strategy(AbstractStrategy):
         if opponent and not self._is_snake_alive(opponent['id'], game_state): return float('inf')
         obstacles = self._get_obstacles_from_state(game_state)
         board_width = game_state['board']['width']; board_height = game_state['board']['height']
-        my_head = (my_snake['head']['x'], my_snake['head']['y'])
-        my_space = flood_fill(my_head, obstacles, board_width, board_height)
-        opp_space = 0
+        my_head = self._head(my_snake)
+        scratch = self._turn.flood_fill_scratch
+        my_space = flood_fill(my_head, obstacles, board_width, board_height, scratch)
+        opp_space = 0; opp_head = None
         if opponent:
-            opp_head = (opponent['head']['x'], opponent['head']['y'])
-            opp_space = flood_fill(opp_head, obstacles, board_width, board_height)
+            opp_head = self._head(opponent)
+            opp_space = flood_fill(opp_head, obstacles, board_width, board_height, scratch)
         space_advantage = my_space - opp_space
         health_advantage = my_snake['health'] - (opponent['health'] if opponent else 0)
+        # One search from both heads settles every food race: a food we reach first
+        # counts fully, and one we reach at the same time as the opponent counts half.
+        owner = territory(my_head, -1 if opp_head is None else opp_head, obstacles, board_width, board_height,
+                          self._turn.territory_scratch)
         food_control_score = 0
         for food in game_state['board']['food']:
-            food_coord = (food['x'], food['y'])
-            my_path = a_star(my_head, food_coord, obstacles, board_width, board_height)
-            opp_path = None
-            if opponent: opp_path = a_star(opp_head, food_coord, obstacles, board_width, board_height)
-            if my_path and (not opp_path or len(my_path) < len(opp_path)): food_control_score += 1
+            if owner[food] == 1: food_control_score += 1
+            elif owner[food] == 3: food_control_score += 0.5
         return (space_advantage * self.HEURISTIC_WEIGHTS['space_adv_weight']) + \
                (health_advantage * self.HEURISTIC_WEIGHTS['health_adv_weight']) + \
                (food_control_score * self.HEURISTIC_WEIGHTS['food_control_weight'])
 
-    def _get_children(self, game_state: dict, is_maximizing_player: bool) -> list:
-        children = []
+    def _get_children(self, game_state: dict, is_maximizing_player: bool,
+                      hash_move: str | None = None) -> Iterator[tuple[str, dict]]:
+        # Children are made on game_state in place and unmade when the search moves on,
+        # so the yielded state is only valid until the next child is requested.
         snake_to_move = game_state['you'] if is_maximizing_player else self._get_opponent(game_state)
-        if not snake_to_move or not self._is_snake_alive(snake_to_move['id'], game_state): return []
-        safe_moves = self._get_safe_moves(snake_to_move, game_state)
-        for move_name, next_coord in safe_moves.items():
-            new_state = copy.deepcopy(game_state)
-            sim_snake = self._find_snake_in_state(snake_to_move['id'], new_state)
-            self._simulate_move(sim_snake, new_state, next_coord)
-            children.append((move_name, new_state))
-        return children
-
-    def _simulate_move(self, snake: dict, state: dict, next_head: tuple):
-        eats_food = False
-        for food in state['board']['food']:
-            if (food['x'], food['y']) == next_head:
-                eats_food = True; state['board']['food'].remove(food); snake['health'] = 100
-                break
-        snake['body'].insert(0, {'x': next_head[0], 'y': next_head[1]})
-        snake['head'] = {'x': next_head[0], 'y': next_head[1]}
-        if not eats_food: snake['body'].pop(); snake['health'] -= 1
-        snake['length'] = len(snake['body'])
+        if not snake_to_move or not self._is_snake_alive(snake_to_move['id'], game_state): return
+        obstacles = self._get_obstacles_from_state(game_state)
+        safe_moves = self._get_safe_moves(snake_to_move, game_state, obstacles)
+        # Search the most promising moves first so Alpha-Beta cuts off as early as possible.
+        # The score is from the moving snake's point of view, so both players want it high.
+        board_width = game_state['board']['width']; board_height = game_state['board']['height']
+        foods = [decode(food, board_width) for food in game_state['board']['food']]
+        scratch = self._turn.flood_fill_scratch
+        order_keys = {}
+        for move_name, next_cell in safe_moves.items():
+            nx, ny = decode(next_cell, board_width)
+            food_dist = min((abs(nx - fx) + abs(ny - fy) for fx, fy in foods), default=0)
+            order_keys[move_name] = flood_fill(next_cell, obstacles, board_width, board_height, scratch) - food_dist
+        # The best move found for this state by an earlier, shallower iteration goes first.
+        if hash_move in order_keys: order_keys[hash_move] = float('inf')
+        for move_name in sorted(safe_moves, key=order_keys.get, reverse=True):
+            undo = self._simulate_move(snake_to_move, game_state, safe_moves[move_name])
+            try:
+                yield move_name, game_state
+            finally:
+                self._unmake_move(snake_to_move, game_state, undo)
+
+    def _ingest(self, game_state: dict) -> dict:
+        """
+        Builds this turn's search state, with the board in node ids (y * width + x); the
+        request's game_state is left untouched. Food becomes a list of node ids, and each
+        snake's list-of-dicts body becomes an int16 ring buffer snake['cells'] running from
+        snake['head_idx'] to snake['tail_idx'] (inclusive, wrapping at snake['cap']), so
+        moving a snake only shifts those two indices.
+        """
+        board = game_state['board']; board_width = board['width']
+        snakes = []
+        for snake in board['snakes']:
+            body = snake['body']
+            # A snake can only grow by eating, and there is at most one food per square.
+            cap = len(body) + board_width * board['height']
+            cells = array('h', bytes(2 * cap))
+            for i, part in enumerate(body): cells[i] = part['y'] * board_width + part['x']
+            snakes.append({key: value for key, value in snake.items() if key not in ('body', 'head')})
+            snakes[-1].update(cells=cells, cap=cap, head_idx=0, tail_idx=len(body) - 1, length=len(body))
+        search_state = dict(game_state, board=dict(board, food=[food['y'] * board_width + food['x'] for food in board['food']],
+                                                   snakes=snakes))
+        # The search moves snakes in place, so 'you' must be the same dict as our board snake.
+        search_state['you'] = self._find_snake_in_state(game_state['you']['id'], search_state)
+        return search_state
+
+    def _head(self, snake: dict) -> int:
+        return snake['cells'][snake['head_idx']]
+
+    def _simulate_move(self, snake: dict, state: dict, next_head: int) -> tuple:
+        """Moves the snake in place and returns the undo record for `_unmake_move`."""
+        old_tail_idx = snake['tail_idx']; old_health = snake['health']
+        eaten_food = None
+        foods = state['board']['food']
+        if next_head in foods:
+            i = foods.index(next_head)
+            eaten_food = (i, foods.pop(i)); snake['health'] = 100
+        head_idx = snake['head_idx'] = (snake['head_idx'] - 1) % snake['cap']
+        snake['cells'][head_idx] = next_head
+        if eaten_food: snake['length'] += 1
+        else: snake['tail_idx'] = (old_tail_idx - 1) % snake['cap']; snake['health'] -= 1
+        return old_tail_idx, eaten_food, old_health
 
-    def _get_safe_moves(self, snake: dict, game_state: dict) -> dict:
-        safe_moves = {}; head = (snake['head']['x'], snake['head']['y'])
+    def _unmake_move(self, snake: dict, state: dict, undo: tuple):
+        old_tail_idx, eaten_food, old_health = undo
+        # The old tail segment is never overwritten, so undoing is pointer arithmetic.
+        snake['head_idx'] = (snake['head_idx'] + 1) % snake['cap']
+        snake['tail_idx'] = old_tail_idx; snake['health'] = old_health
+        if eaten_food: state['board']['food'].insert(*eaten_food); snake['length'] -= 1
+
+    def _get_safe_moves(self, snake: dict, game_state: dict, body_bits: bytearray | None = None) -> dict:
+        safe_moves = {}; head = self._head(snake)
+        board_width = game_state['board']['width']; board_height = game_state['board']['height']
+        if body_bits is None: body_bits = self._get_obstacles_from_state(game_state)
+        x, y = decode(head, board_width)
         possible_moves = {"up": (0, -1), "down": (0, 1), "left": (-1, 0), "right": (1, 0)}
         for move_name, (dx, dy) in possible_moves.items():
-            target_coord = (head[0] + dx, head[1] + dy)
-            if not (0 <= target_coord[0] < game_state['board']['width'] and 0 <= target_coord[1] < game_state['board']['height']): continue
+            if not (0 <= x + dx < board_width and 0 <= y + dy < board_height): continue
+            target = head + dy * board_width + dx
+            if body_bits[target]: continue
             is_deadly = False
-            for s in game_state['board']['snakes']:
-                if target_coord in {(p['x'],p['y']) for p in s['body'][:-1]}: is_deadly = True; break
-            if is_deadly: continue
             for opponent in game_state['board']['snakes']:
                 if opponent['id'] == snake['id']: continue
-                if target_coord == (opponent['head']['x'], opponent['head']['y']):
+                if target == self._head(opponent):
                     if snake['length'] <= opponent['length']: is_deadly = True; break
             if is_deadly: continue
-            safe_moves[move_name] = target_coord
+            safe_moves[move_name] = target
         return safe_moves
 
-    def _get_obstacles_from_state(self, game_state: dict) -> set:
-        obstacles = set();
+    def _get_obstacles_from_state(self, game_state: dict) -> bytearray:
+        # One buffer per thread, refilled on every call; callers are done with it before the next.
+        obstacles = self._turn.obstacles
+        obstacles[:] = self._turn.empty_board
         for snake in game_state['board']['snakes']:
-            for part in snake['body'][:-1]: obstacles.add((part['x'], part['y']))
+            cells, head_idx, cap = snake['cells'], snake['head_idx'], snake['cap']
+            for i in range(snake['length'] - 1): obstacles[cells[(head_idx + i) % cap]] = 1
         return obstacles
 
+    def _hash_state(self, game_state: dict, is_maximizing_player: bool) -> int:
+        # Snakes are named by board index, not id: ids are new every game, and keying
+        # features by them would grow zobrist_hash's key table without bound.
+        features = [('to_move', is_maximizing_player)]
+        for s, snake in enumerate(game_state['board']['snakes']):
+            features.append(('health', s, snake['health']))
+            cells, head_idx, cap = snake['cells'], snake['head_idx'], snake['cap']
+            for i in range(snake['length']): features.append((cells[(head_idx + i) % cap], s, i))
+        for food in game_state['board']['food']: features.append((food, 'food'))
+        return zobrist_hash(features)
+
     def _get_opponent(self, game_state: dict):
         for snake in game_state['board']['snakes']:
             if snake['id'] != game_state['you']['id']: return snake
@@ -1,48 +1,90 @@
 import unittest
 import sys
 import os
+import json
+import copy
+import time
+import threading
+from array import array
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.spatial_utils import a_star, flood_fill
-from utils.game_theory_utils import expectimax
+from utils.spatial_utils import a_star, a_star_len, flood_fill, make_bitboard, encode, decode, adjacency, \
+    a_star_scratch, flood_fill_scratch, territory
+from utils.game_theory_utils import minimax, expectimax, zobrist_hash, TimeUp
+from utils import battlesnake_engine
 
 class TestSpatialUtils(unittest.TestCase):
     """Test cases for spatial utility functions"""
     
     def test_a_star_basic(self):
         # Straight line path
-        path = a_star((0,0), (2,2), set(), 3, 3)
+        path = a_star(encode(0,0,3), encode(2,2,3), make_bitboard([], 3, 3), 3, 3)
         # With 4-direction movement, shortest path is 4 steps
         self.assertEqual(len(path), 5)  # Includes start position
-        self.assertEqual(path, [(0,0), (0,1), (0,2), (1,2), (2,2)])
+        self.assertEqual(path, [encode(0,0,3), encode(0,1,3), encode(0,2,3), encode(1,2,3), encode(2,2,3)])
         
     def test_a_star_obstacles(self):
         # Path around obstacle
-        obstacles = {(1,1)}
-        path = a_star((0,0), (2,2), obstacles, 3, 3)
-        self.assertIn((0,1), path)
-        self.assertNotIn((1,1), path)
+        obstacles = make_bitboard({encode(1,1,3)}, 3, 3)
+        path = a_star(encode(0,0,3), encode(2,2,3), obstacles, 3, 3)
+        self.assertIn(encode(0,1,3), path)
+        self.assertNotIn(encode(1,1,3), path)
         
     def test_a_star_no_path(self):
         # Blocked path
-        obstacles = {(0,1), (1,0), (1,1)}
-        path = a_star((0,0), (2,2), obstacles, 3, 3)
+        obstacles = make_bitboard({encode(0,1,3), encode(1,0,3), encode(1,1,3)}, 3, 3)
+        path = a_star(encode(0,0,3), encode(2,2,3), obstacles, 3, 3)
         self.assertIsNone(path)
         
+    def test_a_star_len(self):
+        obstacles = make_bitboard({encode(1,1,3)}, 3, 3)
+        self.assertEqual(a_star_len(encode(0,0,3), encode(2,2,3), obstacles, 3, 3), 4)
+        self.assertEqual(a_star_len(encode(0,0,3), encode(0,0,3), obstacles, 3, 3), 0)
+        blocked = make_bitboard({encode(0,1,3), encode(1,0,3), encode(1,1,3)}, 3, 3)
+        self.assertIsNone(a_star_len(encode(0,0,3), encode(2,2,3), blocked, 3, 3))
+
     def test_flood_fill_open(self):
         # Full access
-        area = flood_fill((1,1), set(), 3, 3)
+        area = flood_fill(encode(1,1,3), make_bitboard([], 3, 3), 3, 3)
         self.assertEqual(area, 9)
         
     def test_flood_fill_constrained(self):
         # Cross-shaped obstacles
-        obstacles = {(0,1), (1,0), (1,2), (2,1)}
+        obstacles = make_bitboard({encode(0,1,3), encode(1,0,3), encode(1,2,3), encode(2,1,3)}, 3, 3)
         # With all adjacent cells blocked, only starting cell is accessible
-        area = flood_fill((1,1), obstacles, 3, 3)
+        area = flood_fill(encode(1,1,3), obstacles, 3, 3)
         self.assertEqual(area, 1)
 
+    def test_scratch_reuse(self):
+        # Reused buffers are reset, so earlier searches do not leak into later ones
+        flood_scratch = flood_fill_scratch(3, 3); path_scratch = a_star_scratch(3, 3)
+        walled = make_bitboard({encode(1,0,3), encode(1,1,3), encode(1,2,3)}, 3, 3)
+        self.assertEqual(flood_fill(encode(0,0,3), walled, 3, 3, flood_scratch), 3)
+        self.assertIsNone(a_star_len(encode(0,0,3), encode(2,2,3), walled, 3, 3, path_scratch))
+        self.assertEqual(flood_fill(encode(0,0,3), make_bitboard([], 3, 3), 3, 3, flood_scratch), 9)
+        self.assertEqual(a_star(encode(0,0,3), encode(0,2,3), make_bitboard([], 3, 3), 3, 3, path_scratch),
+                         [encode(0,0,3), encode(0,1,3), encode(0,2,3)])
+
+    def test_territory(self):
+        # Squares go to the nearer start, ties to both, walled-off squares to neither
+        owner = territory(encode(0,0,3), encode(2,0,3), make_bitboard({encode(0,2,3), encode(1,2,3)}, 3, 3), 3, 3)
+        self.assertEqual(owner[encode(0,1,3)], 1)
+        self.assertEqual(owner[encode(2,2,3)], 2)
+        self.assertEqual(owner[encode(1,1,3)], 3)
+        self.assertEqual(owner[encode(0,2,3)], 0)
+        self.assertEqual(territory(encode(0,0,3), -1, make_bitboard([], 3, 3), 3, 3)[encode(2,2,3)], 1)
+
+    def test_encode_decode(self):
+        self.assertEqual(encode(2,1,3), 5)
+        self.assertEqual(decode(5, 3), (2,1))
+
+    def test_adjacency_borders(self):
+        neighbors = adjacency(3, 3)
+        self.assertEqual(sorted(neighbors[encode(0,0,3)]), [encode(1,0,3), encode(0,1,3)])
+        self.assertEqual(len(neighbors[encode(1,1,3)]), 4)
+
 class TestGameTheoryUtils(unittest.TestCase):
     """Test cases for game theory utilities"""
     
@@ -81,5 +123,156 @@ class TestGameTheoryUtils(unittest.TestCase):
         self.assertEqual(score, 0)
         self.assertIsNone(move)
 
+    def test_minimax_opponent(self):
+        # Opponent picks the minimum
+        def eval_fn(state): return state['value']
+        def children_fn(state, is_max):
+            if is_max:
+                return [('max_move', {'value': 5})]
+            return [('min1', {'value': 3}), ('min2', {'value': 5})]
+
+        score, move = minimax({'value': 0}, 2, True, eval_fn, children_fn)
+        self.assertEqual(score, 3)
+        self.assertEqual(move, 'max_move')
+
+    def test_minimax_transposition_table(self):
+        # Both move orders reach the same state, which is evaluated only once
+        evaluated = []
+        def eval_fn(state):
+            evaluated.append(state['moves'])
+            return sum(state['moves'])
+        def children_fn(state, is_max, hash_move):
+            return [(m, {'moves': state['moves'] | {m}}) for m in (1, 2) if m not in state['moves']]
+        def hash_fn(state, is_max):
+            return zobrist_hash(list(state['moves']) + [is_max])
+
+        table = {}
+        score, move = minimax({'moves': frozenset()}, 2, True, eval_fn, children_fn,
+                              transposition_table=table, hash_func=hash_fn)
+        self.assertEqual(score, 3)
+        self.assertEqual(len(evaluated), 1)
+
+    def test_minimax_hash_move(self):
+        # A deeper search is told the best move a shallower one stored for the root
+        hints = []
+        def children_fn(state, is_max, hash_move):
+            if state['value'] == 0: hints.append(hash_move)
+            return [('a', {'value': 1}), ('b', {'value': 2})]
+
+        table = {}
+        for depth in (1, 2):
+            minimax({'value': 0}, depth, True, lambda s: s['value'], children_fn,
+                    transposition_table=table, hash_func=lambda s, m: (s['value'], m))
+        self.assertEqual(hints, [None, 'b'])
+
+    def test_minimax_generator_children(self):
+        # Children made in place must be unmade, including pruned ones
+        def eval_fn(state): return state['value']
+        def children_fn(state, is_max):
+            for move, delta in (('a', 1), ('b', -4), ('c', 2)):
+                state['value'] += delta
+                try:
+                    yield move, state
+                finally:
+                    state['value'] -= delta
+
+        state = {'value': 0}
+        score, move = minimax(state, 2, True, eval_fn, children_fn)
+        self.assertEqual((score, move), (-2, 'c'))
+        self.assertEqual(state, {'value': 0})
+
+    def test_minimax_deadline(self):
+        # A passed deadline aborts the search
+        with self.assertRaises(TimeUp):
+            minimax({'score': 0}, 1, True, lambda s: s['score'],
+                    lambda s, m: [('move', {'score': 1})], deadline=0.0)
+
+    def test_zobrist_hash_order_independent(self):
+        self.assertEqual(zobrist_hash([(0, 0, 'food'), (1, 2, 'food')]),
+                         zobrist_hash([(1, 2, 'food'), (0, 0, 'food')]))
+        self.assertNotEqual(zobrist_hash([(0, 0, 'food')]), zobrist_hash([(0, 1, 'food')]))
+
+    def test_zobrist_hash_threads(self):
+        # Threads keying the same new features concurrently agree on every hash
+        features = [('threads', i) for i in range(2000)]
+        hashes = []
+        threads = [threading.Thread(target=lambda: hashes.append(zobrist_hash(features))) for _ in range(8)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(len(set(hashes)), 1)
+
+class TestBattlesnakeEngine(unittest.TestCase):
+    """Test cases for the fused search engine"""
+
+    WEIGHTS = array('d', [1.0, 0.1, 5.0])
+
+    def test_search_only_move(self):
+        # On a 3x1 board the only move off the left end is right, onto the food
+        buffers = battlesnake_engine.new_buffers(3, 1, 2, 4, 1)
+        battlesnake_engine.load_position(buffers, [[0], [2]], [50, 50], [1])
+        _, move, _ = battlesnake_engine.search(buffers, 1, self.WEIGHTS, 1000)
+        self.assertEqual(battlesnake_engine.MOVES[move], 'right')
+
+    def test_search_node_limit(self):
+        # Running out of nodes gives no move rather than a half-searched one
+        buffers = battlesnake_engine.new_buffers(3, 3, 2, 12, 4)
+        battlesnake_engine.load_position(buffers, [[0], [8]], [50, 50], [4])
+        self.assertIsNone(battlesnake_engine.search(buffers, 4, self.WEIGHTS, 3)[1])
+
+    def test_search_matches_strategy(self):
+        # Same move and score as the Python search in strategies/battlesnake_ultimate.py
+        from strategies.battlesnake_ultimate import Strategy
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_game_state.json')) as f:
+            game_state = json.load(f)
+        board = game_state['board']; width = board['width']
+        you = next(s for s in board['snakes'] if s['id'] == game_state['you']['id'])
+        snakes = [you] + [s for s in board['snakes'] if s is not you]
+        bodies = [[p['y'] * width + p['x'] for p in s['body']] for s in snakes]
+        buffers = battlesnake_engine.new_buffers(width, board['height'], len(snakes),
+                                                 len(max(bodies, key=len)) + width * board['height'], 3, tt_bits=0)
+        battlesnake_engine.load_position(buffers, bodies, [s['health'] for s in snakes],
+                                         [f['y'] * width + f['x'] for f in board['food']])
+        score, move, _ = battlesnake_engine.search(buffers, 3, self.WEIGHTS, 10**9)
+
+        strategy = Strategy(); strategy._turn.prepare(width, board['height'])
+        game_state = strategy._ingest(game_state)
+        expected = minimax(game_state, 3, True, strategy._evaluate_heuristic, strategy._get_children,
+                           float('-inf'), float('inf'))
+        self.assertEqual((score, battlesnake_engine.MOVES[move]), expected)
+
+class TestUltimateStrategy(unittest.TestCase):
+    """Test cases for strategies/battlesnake_ultimate.py"""
+
+    def test_search_leaves_game_state_untouched(self):
+        # Both search paths work on their own copy, so the request can be searched again
+        from strategies.battlesnake_ultimate import Strategy
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_game_state.json')) as f:
+            game_state = json.load(f)
+        original = copy.deepcopy(game_state)
+        strategy = Strategy(); strategy.MAX_SEARCH_DEPTH = 2
+        strategy._search(game_state, time.perf_counter() + 1.0)
+        self.assertEqual(game_state, original)
+        strategy._search_with_engine(game_state, time.perf_counter() + 1.0)
+        self.assertEqual(game_state, original)
+
+    def test_search_keeps_move_when_every_line_loses(self):
+        # With 2 health and no food we starve at any depth; both searches keep the last move found
+        from strategies.battlesnake_ultimate import Strategy
+        def snake(snake_id, body, health):
+            return {'id': snake_id, 'health': health, 'length': len(body),
+                    'body': [{'x': x, 'y': y} for x, y in body], 'head': {'x': body[0][0], 'y': body[0][1]}}
+        you = snake('you', [(3,0), (3,1), (3,2)], 2)
+        game_state = {'turn': 3, 'you': you,
+                      'board': {'width': 6, 'height': 6, 'food': [], 'snakes': [you, snake('opp', [(0,5), (1,5), (2,5)], 90)]}}
+        strategy = Strategy()
+        python_move, _ = strategy._search(game_state, time.perf_counter() + 1.0)
+        engine_move, _ = strategy._search_with_engine(game_state, time.perf_counter() + 1.0)
+        self.assertIn(python_move, ('left', 'right'))
+        self.assertEqual(python_move, engine_move)
+        self.assertIn(strategy.on_game_move(game_state)['move'], ('left', 'right'))
+        # With 1 health even depth 1 finds no move, and a safe move is still chosen
+        you['health'] = 1
+        self.assertIn(strategy.on_game_move(game_state)['move'], ('left', 'right'))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,317 @@
+# utils/battlesnake_engine.py
+
+import math
+from array import array
+
+from utils.spatial_utils import njit, flood_fill_nb, neighbor_table, territory_nb, flood_fill_scratch, territory_scratch
+
+"""
+A fused Battlesnake search. Minimax with Alpha-Beta pruning, make/unmake moves,
+move ordering, a fixed-size transposition table and the UltimateBot heuristic all
+run over flat buffers, so with Numba installed a whole search is one compiled call
+with no Python frames per node.
+
+The position lives in the buffers returned by new_buffers:
+- cells: snake s's body as a ring buffer of node ids in cells[s * cap:(s + 1) * cap].
+- snakes: head_idx, tail_idx, length and health of snake s in snakes[4 * s:4 * s + 4].
+  Snake 0 is the maximizing player and snake 1 its opponent; others only block squares.
+- food: node ids of the food in food[:params[P_NUM_FOOD]].
+
+- new_buffers: Allocates the buffers for a position.
+- load_position: Fills the buffers from snake bodies and food. Buffers can be loaded
+  again for the next position, so they only need allocating once per board.
+- search: Runs one depth-limited search and returns the best move.
+- warm_up: Compiles the search ahead of the first real call.
+"""
+
+MOVES = ("up", "down", "left", "right")
+_MOVE_DX = (0, 0, -1, 1)
+_MOVE_DY = (-1, 1, 0, 0)
+
+# Slots of the params buffer.
+P_WIDTH, P_HEIGHT, P_NUM_SNAKES, P_CAP, P_NUM_FOOD = 0, 1, 2, 3, 4
+# Slots of the counters buffer: nodes visited, node limit, aborted flag.
+C_NODES, C_LIMIT, C_ABORTED = 0, 1, 2
+
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+# Transposition table keys are two 31-bit polynomial hashes side by side, which keeps
+# every intermediate product inside an int64 both in Python and under Numba.
+_M1, _P1 = 2147483647, 1000003
+_M2, _P2 = 2147483629, 1000033
+
+def new_buffers(width: int, height: int, num_snakes: int, cap: int, max_depth: int, tt_bits: int = 16) -> tuple:
+    """
+    Allocates everything search needs for one position.
+
+    Args:
+        width, height: Board size.
+        num_snakes: Number of snakes on the board.
+        cap: Ring buffer capacity per snake; must exceed the longest snake can grow to.
+        max_depth: The deepest search that will be run on these buffers.
+        tt_bits: log2 of the transposition table size. 0 disables the table.
+
+    Returns:
+        A tuple of buffers to pass to load_position and search.
+    """
+    n = width * height
+    params = array('i', [width, height, num_snakes, cap, 0])
+    cells = array('h', [0]) * (num_snakes * cap)
+    snakes = array('i', [0]) * (4 * num_snakes)
+    food = array('h', [0]) * n
+    obstacles = bytearray(n)
+    # Per ply: 4 candidate targets then the order to search them in, and the 4 ordering keys.
+    ply_moves = array('i', [0]) * (8 * (max_depth + 1))
+    ply_keys = array('d', [0.0]) * (4 * (max_depth + 1))
+    tt_size = 1 << tt_bits if tt_bits else 0
+    tt_keys = array('q', [0]) * tt_size
+    tt_scores = array('d', [0.0]) * tt_size
+    tt_info = array('i', [0]) * (3 * tt_size)  # depth, flag, move
+    counters = array('q', [0, 0, 0])
+    return (params, cells, snakes, food, obstacles, *flood_fill_scratch(width, height), neighbor_table(width, height),
+            *territory_scratch(width, height), ply_moves, ply_keys, tt_keys, tt_scores, tt_info, counters)
+
+def load_position(buffers: tuple, bodies: list[list[int]], healths: list[int], foods: list[int]):
+    """
+    Copies a position into the buffers and clears the transposition table. bodies[0] is
+    the maximizing snake, bodies[1] its opponent; each body is a list of node ids from
+    head to tail.
+    """
+    params, cells, snakes, food = buffers[0], buffers[1], buffers[2], buffers[3]
+    cap = params[P_CAP]
+    for s, body in enumerate(bodies):
+        for i, node in enumerate(body): cells[s * cap + i] = node
+        snakes[4 * s:4 * s + 4] = array('i', [0, len(body) - 1, len(body), healths[s]])
+    for i, node in enumerate(foods): food[i] = node
+    params[P_NUM_FOOD] = len(foods)
+    _clear_nb(buffers[-4])  # tt_keys; an all-zero key marks an empty slot.
+
+def search(buffers: tuple, depth: int, weights: array, node_limit: int) -> tuple[float, int | None, int]:
+    """
+    Depth-limited Minimax with Alpha-Beta pruning from the loaded position.
+    The transposition table in buffers is kept, so repeated calls deepen iteratively.
+
+    Args:
+        buffers: From new_buffers, filled by load_position.
+        depth: Plies to search; each player's move is one ply.
+        weights: array('d') of the space, health and food control weights.
+        node_limit: Give up after visiting this many nodes.
+
+    Returns:
+        A tuple of (score, move_index, nodes). move_index indexes MOVES and is None
+        when there is no move or the search hit node_limit before finishing.
+    """
+    counters = buffers[-1]
+    counters[C_NODES] = 0; counters[C_LIMIT] = node_limit; counters[C_ABORTED] = 0
+    score, move = _search_nb(depth, True, -math.inf, math.inf, 0, weights, *buffers)
+    nodes = counters[C_NODES]
+    if counters[C_ABORTED] or move == -1: return score, None, nodes
+    return score, move, nodes
+
+def warm_up():
+    """Compiles the search on a tiny board so the first real call is not slowed down."""
+    buffers = new_buffers(3, 1, 2, 4, 2)
+    load_position(buffers, [[0], [2]], [100, 100], [1])
+    search(buffers, 2, array('d', [1.0, 0.1, 5.0]), 1000)
+
+# --- Numba kernels ---
+
+@njit(cache=True, nogil=True)
+def _search_nb(depth, is_max, alpha, beta, ply, weights, params, cells, snakes, food, obstacles, visited, stack,
+               neighbors, owner, dist, queue, ply_moves, ply_keys,
+               tt_keys, tt_scores, tt_info, counters):
+    counters[C_NODES] += 1
+    if counters[C_NODES] > counters[C_LIMIT]:
+        counters[C_ABORTED] = 1
+        return 0.0, -1
+
+    tt_size = len(tt_keys)
+    key = 0; slot = 0
+    if tt_size:
+        key = _hash_nb(is_max, params, cells, snakes, food)
+        slot = key & (tt_size - 1)
+        if tt_keys[slot] == key and tt_info[3 * slot] >= depth:
+            score = tt_scores[slot]; flag = tt_info[3 * slot + 1]; move = int(tt_info[3 * slot + 2])
+            if flag == TT_EXACT: return score, move
+            if flag == TT_LOWER and score >= beta: return score, move
+            if flag == TT_UPPER and score <= alpha: return score, move
+    orig_alpha = alpha; orig_beta = beta
+
+    mover = 0 if is_max else 1
+    num_moves = 0
+    if depth > 0 and mover < params[P_NUM_SNAKES] and snakes[4 * mover + 3] > 0:
+        hash_move = -1
+        if tt_size and tt_keys[slot] == key: hash_move = tt_info[3 * slot + 2]
+        num_moves = _order_moves_nb(mover, ply, hash_move, params, cells, snakes, food, obstacles, visited, stack,
+                                    ply_moves, ply_keys)
+
+    best_eval = -math.inf if is_max else math.inf
+    best_move = -1
+    for j in range(num_moves):
+        move = int(ply_moves[8 * ply + 4 + j])
+        target = ply_moves[8 * ply + move]
+        old_tail, eaten, old_health = _make_move_nb(mover, target, params, cells, snakes, food)
+        evaluation, _ = _search_nb(depth - 1, not is_max, alpha, beta, ply + 1, weights, params, cells, snakes, food,
+                                   obstacles, visited, stack, neighbors, owner, dist, queue,
+                                   ply_moves, ply_keys, tt_keys, tt_scores, tt_info, counters)
+        _unmake_move_nb(mover, target, old_tail, eaten, old_health, params, snakes, food)
+        if counters[C_ABORTED]: return 0.0, -1
+        if is_max:
+            if evaluation > best_eval:
+                best_eval = evaluation; best_move = move
+            alpha = max(alpha, evaluation)
+        else:
+            if evaluation < best_eval:
+                best_eval = evaluation; best_move = move
+            beta = min(beta, evaluation)
+        if beta <= alpha: break  # Prune
+
+    if num_moves == 0:
+        score = _evaluate_nb(weights, params, cells, snakes, food, obstacles, visited, stack,
+                             neighbors, owner, dist, queue)
+        if tt_size:
+            tt_keys[slot] = key; tt_scores[slot] = score
+            tt_info[3 * slot] = depth; tt_info[3 * slot + 1] = TT_EXACT; tt_info[3 * slot + 2] = -1
+        return score, -1
+
+    if tt_size:
+        # A score outside the original window only bounds the true value.
+        if best_eval <= orig_alpha: flag = TT_UPPER
+        elif best_eval >= orig_beta: flag = TT_LOWER
+        else: flag = TT_EXACT
+        tt_keys[slot] = key; tt_scores[slot] = best_eval
+        tt_info[3 * slot] = depth; tt_info[3 * slot + 1] = flag; tt_info[3 * slot + 2] = best_move
+    return best_eval, best_move
+
+@njit(cache=True, nogil=True)
+def _order_moves_nb(s, ply, hash_move, params, cells, snakes, food, obstacles, visited, stack, ply_moves, ply_keys):
+    # Writes snake s's safe move targets (-1 if unsafe) to ply_moves[8 * ply:8 * ply + 4] and
+    # the safe moves, most promising first, to ply_moves[8 * ply + 4:]. Returns how many are safe.
+    width = params[P_WIDTH]; height = params[P_HEIGHT]; cap = params[P_CAP]
+    num_snakes = params[P_NUM_SNAKES]; num_food = params[P_NUM_FOOD]
+    _build_obstacles_nb(params, cells, snakes, obstacles)
+    head = cells[s * cap + snakes[4 * s]]
+    x = head % width; y = head // width
+    count = 0
+    for d in range(4):
+        ply_moves[8 * ply + d] = -1
+        nx = x + _MOVE_DX[d]; ny = y + _MOVE_DY[d]
+        if not (0 <= nx < width and 0 <= ny < height): continue
+        target = ny * width + nx
+        if obstacles[target]: continue
+        deadly = False
+        for o in range(num_snakes):
+            if o == s: continue
+            if target == cells[o * cap + snakes[4 * o]] and snakes[4 * s + 2] <= snakes[4 * o + 2]:
+                deadly = True; break
+        if deadly: continue
+        ply_moves[8 * ply + d] = target
+
+        # Open space minus distance to the nearest food, from the moving snake's point of view.
+        food_dist = 0
+        for i in range(num_food):
+            dist = abs(nx - food[i] % width) + abs(ny - food[i] // width)
+            if i == 0 or dist < food_dist: food_dist = dist
+        order_key = float(flood_fill_nb(obstacles, width, target, visited, stack) - food_dist)
+        if d == hash_move: order_key = math.inf
+
+        # Stable insertion sort, highest key first.
+        j = count
+        while j > 0 and ply_keys[4 * ply + j - 1] < order_key:
+            ply_keys[4 * ply + j] = ply_keys[4 * ply + j - 1]
+            ply_moves[8 * ply + 4 + j] = ply_moves[8 * ply + 4 + j - 1]
+            j -= 1
+        ply_keys[4 * ply + j] = order_key
+        ply_moves[8 * ply + 4 + j] = d
+        count += 1
+    return count
+
+@njit(cache=True, nogil=True)
+def _make_move_nb(s, target, params, cells, snakes, food):
+    # Moves snake s onto target in place and returns the undo record (old_tail, eaten, old_health).
+    cap = params[P_CAP]
+    old_tail = snakes[4 * s + 1]; old_health = snakes[4 * s + 3]
+    eaten = -1
+    num_food = params[P_NUM_FOOD]
+    for i in range(num_food):
+        if food[i] == target:
+            eaten = i; break
+    head_idx = (snakes[4 * s] - 1) % cap
+    snakes[4 * s] = head_idx
+    cells[s * cap + head_idx] = target
+    if eaten >= 0:
+        # Swap the eaten food to the end so it can be put back in the same order.
+        food[eaten] = food[num_food - 1]; food[num_food - 1] = target
+        params[P_NUM_FOOD] = num_food - 1
+        snakes[4 * s + 2] += 1; snakes[4 * s + 3] = 100
+    else:
+        snakes[4 * s + 1] = (old_tail - 1) % cap; snakes[4 * s + 3] = old_health - 1
+    return old_tail, eaten, old_health
+
+@njit(cache=True, nogil=True)
+def _unmake_move_nb(s, target, old_tail, eaten, old_health, params, snakes, food):
+    # The old tail segment is never overwritten, so undoing is pointer arithmetic.
+    snakes[4 * s] = (snakes[4 * s] + 1) % params[P_CAP]
+    snakes[4 * s + 1] = old_tail; snakes[4 * s + 3] = old_health
+    if eaten >= 0:
+        num_food = params[P_NUM_FOOD] + 1
+        params[P_NUM_FOOD] = num_food
+        food[num_food - 1] = food[eaten]; food[eaten] = target
+        snakes[4 * s + 2] -= 1
+
+@njit(cache=True, nogil=True)
+def _evaluate_nb(weights, params, cells, snakes, food, obstacles, visited, stack,
+                 neighbors, owner, dist, queue):
+    width = params[P_WIDTH]; cap = params[P_CAP]
+    has_opponent = params[P_NUM_SNAKES] > 1
+    if snakes[3] <= 0: return -math.inf
+    if has_opponent and snakes[7] <= 0: return math.inf
+    _build_obstacles_nb(params, cells, snakes, obstacles)
+    my_head = cells[snakes[0]]
+    space_advantage = flood_fill_nb(obstacles, width, my_head, visited, stack)
+    health_advantage = snakes[3]
+    opp_head = -1
+    if has_opponent:
+        opp_head = cells[cap + snakes[4]]
+        space_advantage -= flood_fill_nb(obstacles, width, opp_head, visited, stack)
+        health_advantage -= snakes[7]
+
+    # A food we reach first counts fully, and one we reach at the same time as the opponent half.
+    territory_nb(obstacles, neighbors, my_head, opp_head, owner, dist, queue)
+    food_control_score = 0.0
+    for i in range(params[P_NUM_FOOD]):
+        if owner[food[i]] == 1: food_control_score += 1.0
+        elif owner[food[i]] == 3: food_control_score += 0.5
+    return (space_advantage * weights[0]) + (health_advantage * weights[1]) + (food_control_score * weights[2])
+
+@njit(cache=True, nogil=True)
+def _build_obstacles_nb(params, cells, snakes, obstacles):
+    # Every snake's body except its tail, which moves out of the way this turn.
+    cap = params[P_CAP]
+    for i in range(len(obstacles)): obstacles[i] = 0
+    for s in range(params[P_NUM_SNAKES]):
+        head_idx = snakes[4 * s]
+        for i in range(snakes[4 * s + 2] - 1): obstacles[cells[s * cap + (head_idx + i) % cap]] = 1
+
+@njit(cache=True, nogil=True)
+def _clear_nb(buffer):
+    for i in range(len(buffer)): buffer[i] = 0
+
+@njit(cache=True, nogil=True)
+def _hash_nb(is_max, params, cells, snakes, food) -> int:
+    cap = params[P_CAP]
+    h1 = 2 if is_max else 1; h2 = h1
+    for s in range(params[P_NUM_SNAKES]):
+        h1 = (h1 * _P1 + snakes[4 * s + 3] + 1) % _M1; h2 = (h2 * _P2 + snakes[4 * s + 3] + 1) % _M2
+        head_idx = snakes[4 * s]
+        for i in range(snakes[4 * s + 2]):
+            node = cells[s * cap + (head_idx + i) % cap] + 2
+            h1 = (h1 * _P1 + node) % _M1; h2 = (h2 * _P2 + node) % _M2
+        h1 = (h1 * _P1 + 1) % _M1; h2 = (h2 * _P2 + 1) % _M2  # End of this snake's body.
+    # Food is a set, so its contribution must not depend on the order of the buffer.
+    f1 = 0; f2 = 0
+    for i in range(params[P_NUM_FOOD]):
+        f1 = (f1 + (food[i] + 1) * _P2) % _M1; f2 = (f2 + (food[i] + 1) * _P1) % _M2
+    h1 = (h1 * _P1 + f1) % _M1; h2 = (h2 * _P2 + f2) % _M2
+    # The top bit keeps every key non-zero, so an empty slot never matches.
+    return (1 << 62) | (h1 << 31) | h2
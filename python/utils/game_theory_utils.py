@@ -1,6 +1,9 @@
 # utils/game_theory_utils.py
 
-from typing import Callable
+import random
+import threading
+import time
+from typing import Callable, Hashable, Iterable
 
 """
 This module provides a toolbox for game theory algorithms.
@@ -9,8 +12,41 @@ passing in other functions as arguments.
 
 - minimax: For two-player, zero-sum, turn-based games.
 - expectimax: For games with chance or non-optimal opponents.
+- zobrist_hash: Builds transposition table keys from a state's features.
 """
 
+class TimeUp(Exception):
+    """Raised by minimax when its deadline passes before the search finishes."""
+
+# Transposition table entry flags: the stored score is exact, a lower bound or an upper bound.
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+ZOBRIST_KEYS: dict = {}
+_ZOBRIST_LOCK = threading.Lock()
+
+def zobrist_hash(features: Iterable[Hashable]) -> int:
+    """
+    Zobrist hash of a game state described as a collection of features.
+
+    Each distinct feature (e.g. an (x, y, piece) tuple) is assigned a random
+    64-bit key the first time it is seen; the hash is the XOR of those keys.
+    Safe to call from several threads: a feature only ever gets one key.
+
+    Args:
+        features: Hashable values that together describe the state.
+
+    Returns:
+        A 64-bit integer hash.
+    """
+    h = 0
+    for feature in features:
+        key = ZOBRIST_KEYS.get(feature)
+        if key is None:
+            # Another thread may have just keyed the same feature, so only the first key is kept.
+            with _ZOBRIST_LOCK: key = ZOBRIST_KEYS.setdefault(feature, random.getrandbits(64))
+        h ^= key
+    return h
+
 def minimax(
     game_state: dict, 
     depth: int, 
@@ -18,7 +54,10 @@ def minimax(
     evaluate_func: Callable[[dict], float], 
     get_children_func: Callable[[dict, bool], list],
     alpha: float = -float('inf'), 
-    beta: float = float('inf')
+    beta: float = float('inf'),
+    transposition_table: dict | None = None,
+    hash_func: Callable[[dict, bool], int] | None = None,
+    deadline: float | None = None
 ) -> tuple[float, any]:
     """
     Minimax algorithm with Alpha-Beta pruning.
@@ -29,41 +68,88 @@ def minimax(
         is_maximizing_player: True for your turn, False for the opponent's.
         evaluate_func: A function that takes a game_state and returns a score.
         get_children_func: A function that takes (game_state, is_maximizing)
-                           and returns a list of (move, child_state) tuples.
+                           and returns an iterable of (move, child_state) tuples.
+                           A generator may reuse one mutated state for every child.
+                           With a transposition_table it also gets a third argument,
+                           the best move stored for this state by an earlier search
+                           (or None), so it can be searched first.
         alpha: The best value that the maximizer can guarantee.
         beta: The best value that the minimizer can guarantee.
+        transposition_table: Optional dict reused across calls to cache results
+                             of states reached by different move orders.
+        hash_func: A function that takes (game_state, is_maximizing) and returns
+                   a hash key. Required when a transposition_table is given.
+        deadline: Optional time.perf_counter() value after which the search
+                  gives up by raising TimeUp. Used for iterative deepening.
 
     Returns:
         A tuple of (best_score, best_move).
     """
-    children = get_children_func(game_state, is_maximizing_player)
-    if depth == 0 or not children:
-        return evaluate_func(game_state), None
+    if deadline is not None and time.perf_counter() > deadline:
+        raise TimeUp
+    key = None; entry = None
+    if transposition_table is not None:
+        key = hash_func(game_state, is_maximizing_player)
+        entry = transposition_table.get(key)
+        if entry is not None and entry[0] >= depth:
+            _, score, flag, move = entry
+            if flag == TT_EXACT:
+                return score, move
+            if flag == TT_LOWER and score >= beta:
+                return score, move
+            if flag == TT_UPPER and score <= alpha:
+                return score, move
+    orig_alpha, orig_beta = alpha, beta
 
-    if is_maximizing_player:
-        max_eval = -float('inf')
-        best_move = None
-        for move, child_state in children:
-            evaluation, _ = minimax(child_state, depth - 1, False, evaluate_func, get_children_func, alpha, beta)
-            if evaluation > max_eval:
-                max_eval = evaluation
-                best_move = move
-            alpha = max(alpha, evaluation)
-            if beta <= alpha:
-                break  # Prune
-        return max_eval, best_move
-    else:  # Minimizing player
-        min_eval = float('inf')
-        best_move = None
-        for move, child_state in children:
-            evaluation, _ = minimax(child_state, depth - 1, True, evaluate_func, get_children_func, alpha, beta)
-            if evaluation < min_eval:
-                min_eval = evaluation
-                best_move = move
-            beta = min(beta, evaluation)
-            if beta <= alpha:
-                break  # Prune
-        return min_eval, best_move
+    # A depth-0 node is a leaf; so is a node whose player has no moves left.
+    if depth == 0: children = ()
+    elif key is None: children = get_children_func(game_state, is_maximizing_player)
+    else: children = get_children_func(game_state, is_maximizing_player, entry[3] if entry else None)
+    has_children = False
+    best_move = None
+    try:
+        if is_maximizing_player:
+            best_eval = -float('inf')
+            for move, child_state in children:
+                has_children = True
+                evaluation, _ = minimax(child_state, depth - 1, False, evaluate_func, get_children_func, alpha, beta,
+                                        transposition_table, hash_func, deadline)
+                if evaluation > best_eval:
+                    best_eval = evaluation
+                    best_move = move
+                alpha = max(alpha, evaluation)
+                if beta <= alpha:
+                    break  # Prune
+        else:  # Minimizing player
+            best_eval = float('inf')
+            for move, child_state in children:
+                has_children = True
+                evaluation, _ = minimax(child_state, depth - 1, True, evaluate_func, get_children_func, alpha, beta,
+                                        transposition_table, hash_func, deadline)
+                if evaluation < best_eval:
+                    best_eval = evaluation
+                    best_move = move
+                beta = min(beta, evaluation)
+                if beta <= alpha:
+                    break  # Prune
+    finally:
+        # Children may be a generator that makes moves in place; closing it unmakes
+        # a child left pending by a cutoff or a TimeUp.
+        if hasattr(children, 'close'): children.close()
+
+    if not has_children:
+        score = evaluate_func(game_state)
+        if key is not None:
+            transposition_table[key] = (depth, score, TT_EXACT, None)
+        return score, None
+
+    if key is not None:
+        # A score outside the original window only bounds the true value.
+        if best_eval <= orig_alpha: flag = TT_UPPER
+        elif best_eval >= orig_beta: flag = TT_LOWER
+        else: flag = TT_EXACT
+        transposition_table[key] = (depth, best_eval, flag, best_move)
+    return best_eval, best_move
 
 def expectimax(
     game_state: dict,
@@ -82,25 +168,33 @@ def expectimax(
     Returns:
         A tuple of (score, best_move). For chance nodes, best_move is None.
     """
-    children = get_children_func(game_state, is_maximizing_player)
-    if depth == 0 or not children:
+    if depth == 0:
         return evaluate_func(game_state), None
 
+    children = get_children_func(game_state, is_maximizing_player)
     if is_maximizing_player:
         max_eval = -float('inf')
         best_move = None
+        num_children = 0
         for move, child_state in children:
+            num_children += 1
             evaluation, _ = expectimax(child_state, depth - 1, False, evaluate_func, get_children_func)
             if evaluation > max_eval:
                 max_eval = evaluation
                 best_move = move
+        if not num_children:
+            return evaluate_func(game_state), None
         return max_eval, best_move
     else:  # Chance node (opponent's turn)
         avg_score = 0
+        num_children = 0
         for _, child_state in children:
+            num_children += 1
             evaluation, _ = expectimax(child_state, depth - 1, True, evaluate_func, get_children_func)
             avg_score += evaluation
-        
+        if not num_children:
+            return evaluate_func(game_state), None
+
         # Return the average score of all possible outcomes.
         # There is no "best move" for a chance node.
-        return avg_score / len(children), None
\ No newline at end of file
+        return avg_score / num_children, None
\ No newline at end of file
@@ -1,149 +1,388 @@
 # utils/spatial_utils.py
 
+from array import array
 from collections import deque
-from heapq import heappush, heappop
+from functools import lru_cache
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # Numba is optional; the kernels below then run as plain Python.
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        return lambda func: func
 
 """
 This module provides a toolbox of common algorithms for grid-based games.
-These functions are designed to work with a simple, generic representation of a board.
+These functions are designed to work with a simple, generic representation of a board:
+every square is a node id y * width + x (see encode/decode), and obstacles are a flat
+bitboard (see make_bitboard) where node is blocked when obstacles[node] is non-zero.
 
+- encode / decode: Convert between (x, y) coordinates and node ids.
+- make_bitboard: Builds an obstacle bitboard from node ids.
+- adjacency: The on-board neighbors of every node.
 - a_star: Finds the shortest path using a heuristic (e.g., Manhattan distance).
+- a_star_len: Same search as a_star, but only returns the path length.
 - flood_fill: Measures the size of a contiguous area.
+- territory: Which of two starting points reaches each square first.
+- a_star_scratch / flood_fill_scratch / territory_scratch: Reusable work buffers.
+- a_star_nb / flood_fill_nb / territory_nb: The kernels behind those searches, for
+  other Numba-compiled code to call directly, with neighbor_table as their neighbors.
 - bfs: A simple shortest-path algorithm for unweighted grids.
 - dfs: Finds a path, but not necessarily the shortest one.
+- warm_up: Compiles the Numba kernels behind a_star, flood_fill and territory ahead of time.
 """
 
-def a_star(start_coord: tuple, end_coord: tuple, obstacles: set, width: int, height: int) -> list[tuple] | None:
+def encode(x: int, y: int, width: int) -> int:
+    """Node id of the square at (x, y)."""
+    return y * width + x
+
+def decode(node: int, width: int) -> tuple[int, int]:
+    """(x, y) coordinates of a node id."""
+    return node % width, node // width
+
+@lru_cache(maxsize=None)
+def adjacency(width: int, height: int) -> tuple[tuple[int, ...], ...]:
+    """
+    Precomputed neighbors of every node, so searches never test board borders.
+
+    Returns:
+        A tuple indexed by node id. Each entry holds the ids of the on-board
+        neighbors, in the order +width, -width, +1, -1.
+    """
+    return tuple(
+        tuple(n for n in neighbor_table(width, height)[4 * node:4 * node + 4] if n != -1)
+        for node in range(width * height)
+    )
+
+@lru_cache(maxsize=None)
+def neighbor_table(width: int, height: int) -> array:
+    """
+    Flat form of adjacency for the kernels.
+
+    Returns:
+        An array('i') of 4 slots per node, in the same order as adjacency,
+        with -1 where a neighbor is off the board.
+    """
+    table = array('i', [-1]) * (4 * width * height)
+    for node in range(width * height):
+        x, y = node % width, node // width
+        if y + 1 < height: table[4 * node] = node + width
+        if y > 0: table[4 * node + 1] = node - width
+        if x + 1 < width: table[4 * node + 2] = node + 1
+        if x > 0: table[4 * node + 3] = node - 1
+    return table
+
+def make_bitboard(nodes, width: int, height: int) -> bytearray:
+    """
+    Builds a flat obstacle bitboard for the other functions in this module.
+
+    Args:
+        nodes: An iterable of node ids representing blocked squares.
+        width: The width of the board.
+        height: The height of the board.
+
+    Returns:
+        A bytearray of width * height cells, 1 where blocked and 0 where free.
+    """
+    obstacles = bytearray(width * height)
+    for node in nodes: obstacles[node] = 1
+    return obstacles
+
+def a_star(start: int, end: int, obstacles: bytearray, width: int, height: int,
+           scratch: tuple | None = None) -> list[int] | None:
     """
     A* pathfinding algorithm to find the shortest path between two points.
 
     Args:
-        start_coord: (x, y) tuple for the starting point.
-        end_coord: (x, y) tuple for the destination.
-        obstacles: A set of (x, y) tuples representing blocked squares.
+        start: Node id of the starting point.
+        end: Node id of the destination.
+        obstacles: A bitboard of blocked squares (see make_bitboard).
         width: The width of the board.
         height: The height of the board.
+        scratch: Buffers from a_star_scratch to reuse; allocated per call if omitted.
 
     Returns:
-        A list of (x, y) tuples representing the path from start to end,
+        A list of node ids representing the path from start to end,
         or None if no path exists.
     """
-    def manhattan_distance(a, b):
-        return abs(a[0] - b[0]) + abs(a[1] - b[1])
-
-    pq = [(0, start_coord)]  # (priority, coordinate)
-    came_from = {start_coord: None}
-    cost_so_far = {start_coord: 0}
-
-    while pq:
-        _, current = heappop(pq)
-
-        if current == end_coord:
-            path = []
-            while current is not None:
-                path.append(current)
-                current = came_from[current]
-            return path[::-1]  # Reverse to get path from start to end
-
-        x, y = current
-        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            neighbor = (x + dx, y + dy)
-            nx, ny = neighbor
-
-            if not (0 <= nx < width and 0 <= ny < height): continue
-            if neighbor in obstacles and neighbor != end_coord: continue
-
-            new_cost = cost_so_far[current] + 1
-            if neighbor not in cost_so_far or new_cost < cost_so_far[neighbor]:
-                cost_so_far[neighbor] = new_cost
-                priority = new_cost + manhattan_distance(end_coord, neighbor)
-                heappush(pq, (priority, neighbor))
-                came_from[neighbor] = current
-    return None
+    if scratch is None: scratch = a_star_scratch(width, height)
+    length = a_star_nb(obstacles, neighbor_table(width, height), width, height, start, end, *scratch)
+    if length == -1: return None
 
-def flood_fill(start_coord: tuple, obstacles: set, width: int, height: int) -> int:
+    came_from = scratch[0]
+    path = []
+    current = end
+    while current != -1:
+        path.append(current)
+        current = came_from[current]
+    return path[::-1]  # Reverse to get path from start to end
+
+def a_star_len(start: int, end: int, obstacles: bytearray, width: int, height: int,
+               scratch: tuple | None = None) -> int | None:
     """
-    Calculates the number of reachable empty squares from a starting coordinate.
-    Uses a Breadth-First Search (BFS) approach.
+    Shortest path length between two points, computed with A*.
+    Cheaper than a_star when the path itself is not needed.
 
     Args:
-        start_coord: (x, y) tuple for the starting point.
-        obstacles: A set of (x, y) tuples representing blocked squares.
+        Same as a_star.
+
+    Returns:
+        The number of moves from start to end, or None if no path exists.
+    """
+    if scratch is None: scratch = a_star_scratch(width, height)
+    length = a_star_nb(obstacles, neighbor_table(width, height), width, height, start, end, *scratch)
+    return None if length == -1 else length
+
+def a_star_scratch(width: int, height: int) -> tuple:
+    """
+    Work buffers for a_star and a_star_len on a board of this size. They are reset
+    on every call, so one set can be reused for any number of searches, but not by
+    two searches at once.
+
+    Returns:
+        A tuple of (came_from, cost_so_far, buckets, entries) arrays.
+    """
+    n = width * height
+    # f = g + h never exceeds the longest path plus the largest Manhattan distance.
+    num_buckets = n + width + height + 1
+    # A cell is only pushed when one of its 4 neighbors improves it, so 4n + 1 entries suffice.
+    return (array('i', [0]) * n, array('i', [0]) * n,
+            array('i', [0]) * (2 * num_buckets), array('i', [0]) * (2 * (4 * n + 1)))
+
+def flood_fill(start: int, obstacles: bytearray, width: int, height: int, scratch: tuple | None = None) -> int:
+    """
+    Calculates the number of reachable empty squares from a starting node.
+    Uses a scanline (span) fill that sweeps whole rows at a time.
+
+    Args:
+        start: Node id of the starting point.
+        obstacles: A bitboard of blocked squares (see make_bitboard).
         width: The width of the board.
         height: The height of the board.
+        scratch: Buffers from flood_fill_scratch to reuse; allocated per call if omitted.
 
     Returns:
         The total number of squares in the filled area (including the start).
     """
-    if start_coord in obstacles: return 0
-    if not (0 <= start_coord[0] < width and 0 <= start_coord[1] < height): return 0
+    if scratch is None: scratch = flood_fill_scratch(width, height)
+    return flood_fill_nb(obstacles, width, start, *scratch)
 
-    q = deque([start_coord])
-    visited = {start_coord}
-    count = 0
+def flood_fill_scratch(width: int, height: int) -> tuple:
+    """
+    Work buffers for flood_fill on a board of this size, reusable like a_star_scratch.
 
-    while q:
-        x, y = q.popleft()
-        count += 1
-        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            neighbor = (x + dx, y + dy)
-            if neighbor not in visited:
-                if (0 <= neighbor[0] < width and 0 <= neighbor[1] < height and neighbor not in obstacles):
-                    visited.add(neighbor)
-                    q.append(neighbor)
-    return count
+    Returns:
+        A tuple of (visited, stack).
+    """
+    n = width * height
+    return bytearray(n), array('i', [0]) * (2 * n + 1)
+
+def territory(start_a: int, start_b: int, obstacles: bytearray, width: int, height: int,
+              scratch: tuple | None = None) -> bytearray:
+    """
+    Labels every square with whichever starting point reaches it in fewer moves,
+    using a single breadth-first search from both points at once.
+
+    Args:
+        start_a: Node id of the first starting point.
+        start_b: Node id of the second starting point, or -1 to search from start_a alone.
+        obstacles: A bitboard of blocked squares (see make_bitboard).
+        width: The width of the board.
+        height: The height of the board.
+        scratch: Buffers from territory_scratch to reuse; allocated per call if omitted.
+
+    Returns:
+        A bytearray indexed by node id: 1 where start_a is closer, 2 where start_b is
+        closer, 3 on a tie and 0 if unreachable. It is scratch's own buffer, so it is
+        only valid until scratch is used again.
+    """
+    if scratch is None: scratch = territory_scratch(width, height)
+    territory_nb(obstacles, neighbor_table(width, height), start_a, start_b, *scratch)
+    return scratch[0]
+
+def territory_scratch(width: int, height: int) -> tuple:
+    """
+    Work buffers for territory on a board of this size, reusable like a_star_scratch.
 
-def bfs(start_coord: tuple, end_coord: tuple, obstacles: set, width: int, height: int) -> list[tuple] | None:
+    Returns:
+        A tuple of (owner, dist, queue).
+    """
+    n = width * height
+    return bytearray(n), array('i', [0]) * n, array('i', [0]) * n
+
+def warm_up():
+    """Compiles the Numba kernels on a 1x1 board so the first real call is not slowed down."""
+    a_star(0, 0, bytearray(1), 1, 1)
+    flood_fill(0, bytearray(1), 1, 1)
+    territory(0, -1, bytearray(1), 1, 1)
+
+def bfs(start: int, end: int, obstacles: bytearray, width: int, height: int) -> list[int] | None:
     """
     Breadth-First Search to find the shortest path on an unweighted grid.
 
     Returns:
-        A list of (x, y) tuples representing the path, or None.
+        A list of node ids representing the path, or None.
     """
-    q = deque([(start_coord, [start_coord])]) # (coord, path_list)
-    visited = {start_coord}
+    neighbors = adjacency(width, height)
+    q = deque([(start, [start])]) # (node, path_list)
+    visited = bytearray(width * height)
+    visited[start] = 1
 
     while q:
         current, path = q.popleft()
-        if current == end_coord:
+        if current == end:
             return path
         
-        x, y = current
-        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            neighbor = (x + dx, y + dy)
-            if neighbor not in visited:
-                if (0 <= neighbor[0] < width and 0 <= neighbor[1] < height and neighbor not in obstacles):
-                    visited.add(neighbor)
-                    new_path = list(path)
-                    new_path.append(neighbor)
-                    q.append((neighbor, new_path))
+        for neighbor in neighbors[current]:
+            if not visited[neighbor] and not obstacles[neighbor]:
+                visited[neighbor] = 1
+                new_path = list(path)
+                new_path.append(neighbor)
+                q.append((neighbor, new_path))
     return None
 
-def dfs(start_coord: tuple, end_coord: tuple, obstacles: set, width: int, height: int) -> list[tuple] | None:
+def dfs(start: int, end: int, obstacles: bytearray, width: int, height: int) -> list[int] | None:
     """
     Depth-First Search. Finds a path, but NOT guaranteed to be the shortest.
     Useful for maze-solving or checking connectivity.
 
     Returns:
-        A list of (x, y) tuples representing a path, or None.
+        A list of node ids representing a path, or None.
     """
-    stack = [(start_coord, [start_coord])] # (coord, path_list)
-    visited = set()
+    neighbors = adjacency(width, height)
+    stack = [(start, [start])] # (node, path_list)
+    visited = bytearray(width * height)
 
     while stack:
         current, path = stack.pop()
-        if current in visited:
+        if visited[current]:
             continue
-        visited.add(current)
+        visited[current] = 1
         
-        if current == end_coord:
+        if current == end:
             return path
         
-        x, y = current
-        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            neighbor = (x + dx, y + dy)
-            if (0 <= neighbor[0] < width and 0 <= neighbor[1] < height and neighbor not in obstacles):
+        for neighbor in neighbors[current]:
+            if not obstacles[neighbor]:
                 new_path = list(path)
                 new_path.append(neighbor)
                 stack.append((neighbor, new_path))
-    return None
\ No newline at end of file
+    return None
+
+# --- Numba kernels ---
+# These work on flat buffers only and take their scratch space from the caller.
+# They release the GIL, so searches on separate buffers run in parallel threads.
+# neighbors is the flat table from neighbor_table.
+
+@njit(cache=True, nogil=True)
+def flood_fill_nb(obstacles, width, start, visited, stack) -> int:
+    # Span fill: each popped seed is widened to the full run of free cells in its row,
+    # and one new seed is pushed per free stretch directly above and below that run.
+    # A cell is only seeded from the runs above and below it, so stack needs 2n + 1 slots.
+    n = len(visited)
+    if not (0 <= start < n) or obstacles[start]: return 0
+
+    for i in range(n): visited[i] = 0
+    stack[0] = start
+    sp = 1; count = 0
+    while sp > 0:
+        sp -= 1
+        seed = stack[sp]
+        if visited[seed]: continue
+        row = seed - seed % width
+        left = seed; right = seed
+        while left > row and not obstacles[left - 1]: left -= 1
+        while right < row + width - 1 and not obstacles[right + 1]: right += 1
+        for i in range(left, right + 1): visited[i] = 1
+        count += right - left + 1
+
+        # The rows above and below, without a (-width, width) tuple whose element
+        # types would differ when width comes from an int32 buffer.
+        for side in range(2):
+            offset = width if side else -width
+            if not (0 <= left + offset < n): continue
+            in_span = False
+            for idx in range(left + offset, right + offset + 1):
+                if obstacles[idx] or visited[idx]:
+                    in_span = False
+                elif not in_span:
+                    stack[sp] = idx; sp += 1
+                    in_span = True
+    return count
+
+@njit(cache=True, nogil=True)
+def a_star_nb(obstacles, neighbors, width, height, start, end, came_from, cost_so_far, buckets, entries) -> int:
+    # Returns the number of steps from start to end, or -1 if there is no path.
+    # came_from is left holding the predecessor of every reached cell (-1 for the start).
+    #
+    # Edges all cost 1 and Manhattan distance is consistent, so f = g + h is a small integer
+    # that never decreases from one pop to the next. That allows a bucket queue (Dial's
+    # algorithm) instead of a heap: bucket f is a FIFO linked list, with its head at
+    # buckets[2f] and tail at buckets[2f + 1], and entry e holding node entries[2e]
+    # and the next entry entries[2e + 1].
+    n = width * height
+    for i in range(n):
+        came_from[i] = -1; cost_so_far[i] = -1
+    num_buckets = len(buckets) // 2
+    for i in range(2 * num_buckets): buckets[i] = -1
+    ex = end % width; ey = end // width
+    cost_so_far[start] = 0
+
+    pri = abs(ex - start % width) + abs(ey - start // width)
+    entries[0] = start; entries[1] = -1
+    buckets[2 * pri] = 0; buckets[2 * pri + 1] = 0
+    num_entries = 1
+    while True:
+        while pri < num_buckets and buckets[2 * pri] == -1: pri += 1
+        if pri == num_buckets: return -1
+        e = buckets[2 * pri]
+        buckets[2 * pri] = entries[2 * e + 1]
+        current = entries[2 * e]
+        g = cost_so_far[current]
+        # Skip entries left behind when a cell was later reached more cheaply.
+        if g + abs(ex - current % width) + abs(ey - current // width) != pri: continue
+        if current == end: return g
+
+        new_cost = g + 1
+        for k in range(4 * current, 4 * current + 4):
+            idx = neighbors[k]
+            if idx == -1: continue
+            if obstacles[idx] and idx != end: continue
+
+            if cost_so_far[idx] == -1 or new_cost < cost_so_far[idx]:
+                cost_so_far[idx] = new_cost
+                came_from[idx] = current
+                f = new_cost + abs(ex - idx % width) + abs(ey - idx // width)
+                entries[2 * num_entries] = idx; entries[2 * num_entries + 1] = -1
+                if buckets[2 * f] == -1: buckets[2 * f] = num_entries
+                else: entries[2 * buckets[2 * f + 1] + 1] = num_entries
+                buckets[2 * f + 1] = num_entries
+                num_entries += 1
+
+@njit(cache=True, nogil=True)
+def territory_nb(obstacles, neighbors, start_a, start_b, owner, dist, queue):
+    # Two-source BFS. owner holds bit 1 for start_a and bit 2 for start_b. The queue is
+    # FIFO, so every square at distance d has all its owner bits before any is dequeued,
+    # and a square reached again at the same distance just gains the other bit.
+    for i in range(len(owner)): owner[i] = 0
+    owner[start_a] = 1; dist[start_a] = 0
+    queue[0] = start_a
+    qtail = 1
+    if start_b != -1:
+        if start_b == start_a: owner[start_a] = 3
+        else:
+            owner[start_b] = 2; dist[start_b] = 0
+            queue[1] = start_b; qtail = 2
+    qhead = 0
+    while qhead < qtail:
+        current = queue[qhead]; qhead += 1
+        d = dist[current] + 1
+        for k in range(4 * current, 4 * current + 4):
+            idx = neighbors[k]
+            if idx == -1 or obstacles[idx]: continue
+            if owner[idx] == 0:
+                owner[idx] = owner[current]; dist[idx] = d
+                queue[qtail] = idx; qtail += 1
+            elif dist[idx] == d:
+                owner[idx] |= owner[current]